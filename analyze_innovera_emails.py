@@ -3,29 +3,168 @@ import pandas as pd
 import numpy as np  # Added numpy import
 
 import matplotlib.pyplot as plt
+from collections import Counter
 from datetime import datetime
 
+from keyword_analysis import KeywordIndex
+from parallel_analysis import ParallelAggregator, merge_counts
+from participants import co_occurrence, person_response_times, person_volume
+from report_cache import ReportCache
+
 class InnoveraEmailAnalyzer:
-    def __init__(self, db_path='innovera_domain_emails.db'):
+    # Bump when the layout of the cached stats changes
+    REPORT_CACHE_NAME = 'innovera_report_v1'
+    STATS_COLUMNS = ['recipient', 'date', 'time', 'direction']
+
+    def __init__(self, db_path='innovera_domain_emails.db', workers=None):
+        self.db_path = db_path
+        self.workers = workers
         self.conn = sqlite3.connect(db_path)
-        # Read all emails into a DataFrame
-        self.df = pd.read_sql_query("""
-            SELECT 
-                recipient,
-                date,
-                time,
-                subject,
-                body,
-                direction
-            FROM innovera_emails
-            ORDER BY date, time
-        """, self.conn)
-        
-        # Convert date and time columns to datetime
-        self.df['datetime'] = pd.to_datetime(self.df['date'] + ' ' + self.df['time'])
+        self.cache = ReportCache(self.conn)
+        self._df = None
+
+    @property
+    def df(self):
+        """Full innovera_emails DataFrame, loaded on first use"""
+        if self._df is None:
+            # Read all emails into a DataFrame
+            self._df = pd.read_sql_query("""
+                SELECT 
+                    recipient,
+                    date,
+                    time,
+                    subject,
+                    body,
+                    direction
+                FROM innovera_emails
+                ORDER BY date, time
+            """, self.conn)
+            
+            # Convert date and time columns to datetime
+            self._df['datetime'] = pd.to_datetime(self._df['date'] + ' ' + self._df['time'])
+        return self._df
+
+    @staticmethod
+    def _new_stats():
+        """Empty report stats; every field is mergeable across row batches"""
+        return {
+            'total': 0,
+            'first': None,
+            'last': None,
+            'recipients': {},
+            'directions': {},
+            'hours': {},
+            'months': {},
+            'years': {}
+        }
+
+    @staticmethod
+    def _accumulate_stats(stats, rows):
+        """Fold (recipient, date, time, direction) rows into the report stats"""
+        for recipient, date, time, direction in rows:
+            stamp = f'{date} {time}'
+            stats['total'] += 1
+            if stats['first'] is None or stamp < stats['first']:
+                stats['first'] = stamp
+            if stats['last'] is None or stamp > stats['last']:
+                stats['last'] = stamp
+
+            for field, key in (
+                ('recipients', recipient),
+                ('directions', direction),
+                ('hours', str(int(time[:2]))),
+                ('months', date[:7]),
+                ('years', date[:4])
+            ):
+                stats[field][key] = stats[field].get(key, 0) + 1
+
+    @staticmethod
+    def _merge_stats(stats, partial):
+        """Merge stats computed over another partition into stats"""
+        if not partial['total']:
+            return
+        stats['total'] += partial['total']
+        stats['first'] = min(filter(None, (stats['first'], partial['first'])))
+        stats['last'] = max(filter(None, (stats['last'], partial['last'])))
+        for field in ('recipients', 'directions', 'hours', 'months', 'years'):
+            merge_counts(stats[field], partial[field])
+
+    def _load_stats(self):
+        """Report stats, served from the cache when nothing new was synced"""
+        return self.cache.get_stats(
+            self.REPORT_CACHE_NAME,
+            'innovera_emails',
+            self.STATS_COLUMNS,
+            self._new_stats,
+            self._accumulate_stats,
+            full_scan=ParallelAggregator(
+                self.db_path, 'innovera_emails', self.STATS_COLUMNS, self._new_stats,
+                self._accumulate_stats, self._merge_stats, self.workers
+            ).run
+        )
+
+    def get_person_volume(self, role=None):
+        """Emails per participant address from the participants table"""
+        return person_volume(self.conn, role)
+
+    def get_person_response_times(self):
+        """Average reply time in hours per sender, within threads"""
+        return person_response_times(self.conn, 'innovera_emails', "date || ' ' || time")
+
+    def get_co_occurrence(self, address, top_n=10):
+        """Addresses most often on the same emails as the given address"""
+        return co_occurrence(self.conn, address, top_n)
+
+    def print_participant_report(self, top_n=10):
+        """Print per-person volume, response time and co-occurrence"""
+        print("\nParticipant Analysis")
+        print("====================")
+        
+        try:
+            volume = self.get_person_volume()
+        except sqlite3.OperationalError:
+            # Database synced before the participants table existed
+            volume = []
+        if not volume:
+            print("No participant data - re-run innovera_domain_sync.py")
+            return
+        
+        print("\nEmails per Participant (From/To/Cc/Reply-To):")
+        for address, count in volume[:top_n]:
+            print(f"  - {address}: {count} emails")
+        
+        print("\nAverage Response Time per Sender:")
+        for address, avg_hours, replies in self.get_person_response_times():
+            print(f"  - {address}: {avg_hours:.2f} hours over {replies} replies")
+        
+        print("\nMost Frequent Co-participants:")
+        for address, _ in volume[:top_n]:
+            others = self.get_co_occurrence(address, top_n=3)
+            if others:
+                listed = ', '.join(f"{other} ({shared})" for other, shared in others)
+                print(f"  - {address}: {listed}")
+
+    def print_keyword_report(self, top_n=15, top_recipients=5):
+        """Print the most used terms overall and for the busiest recipients"""
+        keywords = KeywordIndex(self.conn, 'innovera_emails')
+        keywords.update()
+        
+        print("\nKeyword Analysis")
+        print("================")
+        print("\nTop Terms:")
+        for term, count in keywords.top_terms(top_n):
+            print(f"  - {term}: {count}")
+        
+        print("\nTop Terms per Recipient:")
+        recipient_counts = Counter(self._load_stats()['recipients'])
+        for recipient, _ in recipient_counts.most_common(top_recipients):
+            terms = keywords.top_terms(5, recipient=recipient)
+            print(f"  - {recipient}: {', '.join(term for term, _ in terms)}")
 
     def generate_visualizations(self):
         """Create comprehensive email pattern visualizations"""
+        stats = self._load_stats()
+        
         # Set figure size and create subplots
         fig = plt.figure(figsize=(15, 10))
         
@@ -34,7 +173,9 @@ class InnoveraEmailAnalyzer:
         
         # 1. Email Volume Over Time
         ax1 = fig.add_subplot(gs[0, :])
-        monthly_counts = self.df.resample('M', on='datetime').size()
+        monthly_counts = pd.Series(stats['months'], dtype='int64')
+        monthly_counts.index = pd.to_datetime(monthly_counts.index)
+        monthly_counts = monthly_counts.sort_index().resample('M').sum()
         ax1.plot(monthly_counts.index, monthly_counts.values, marker='o', color='royalblue', linewidth=2)
         ax1.set_title('Email Volume Over Time', fontsize=12, pad=15)
         ax1.set_xlabel('Date', fontsize=10)
@@ -44,7 +185,7 @@ class InnoveraEmailAnalyzer:
         
         # 2. Email Distribution by Recipient
         ax2 = fig.add_subplot(gs[1, 0])
-        recipient_counts = self.df['recipient'].value_counts()
+        recipient_counts = pd.Series(stats['recipients']).sort_values(ascending=False)
         colors = plt.cm.Set3(np.linspace(0, 1, len(recipient_counts)))
         ax2.pie(recipient_counts.values, labels=recipient_counts.index, 
                 autopct='%1.1f%%', colors=colors, startangle=90)
@@ -52,7 +193,7 @@ class InnoveraEmailAnalyzer:
         
         # 3. Email Activity by Hour
         ax3 = fig.add_subplot(gs[1, 1])
-        hourly_counts = self.df['datetime'].dt.hour.value_counts().sort_index()
+        hourly_counts = pd.Series({int(hour): count for hour, count in stats['hours'].items()}).sort_index()
         bars = ax3.bar(hourly_counts.index, hourly_counts.values, 
                       color='lightcoral', alpha=0.7)
         ax3.set_title('Email Activity by Hour', fontsize=12, pad=15)
@@ -104,24 +245,27 @@ class InnoveraEmailAnalyzer:
         print("\nInnovera Email Analysis Report")
         print("=============================")
         
+        stats = self._load_stats()
+        
         # Basic statistics
-        total_emails = len(self.df)
-        unique_recipients = self.df['recipient'].nunique()
+        total_emails = stats['total']
+        unique_recipients = len(stats['recipients'])
         
         print(f"\nTotal Emails: {total_emails}")
         print(f"Unique Recipients: {unique_recipients}")
         
         if total_emails > 0:
-            print(f"Date Range: {self.df['datetime'].min():%Y-%m-%d} to {self.df['datetime'].max():%Y-%m-%d}")
+            print(f"Date Range: {stats['first'][:10]} to {stats['last'][:10]}")
             
             # Emails per recipient
             print("\nEmails per Recipient:")
-            recipient_counts = self.df['recipient'].value_counts()
-            for recipient, count in recipient_counts.items():
+            recipient_counts = Counter(stats['recipients'])
+            for recipient, count in recipient_counts.most_common():
                 print(f"  - {recipient}: {count} emails")
             
             # Most active times
-            busiest_hour = self.df['datetime'].dt.hour.mode().iloc[0]
+            hours = stats['hours']
+            busiest_hour = int(min(hours, key=lambda hour: (-hours[hour], int(hour))))
             print(f"\nMost Active Hour: {busiest_hour:02d}:00")
         
         print("\nFiles Generated:")
@@ -142,6 +286,8 @@ def main():
     
     # Print report
     analyzer.print_report()
+    analyzer.print_participant_report()
+    analyzer.print_keyword_report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
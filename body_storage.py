@@ -0,0 +1,193 @@
+import hashlib
+import re
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Attribution lines introducing a ">"-quoted block
+ATTRIBUTION_PATTERNS = [
+    re.compile(r'^On .+ wrote:\s*$', re.DOTALL),             # Gmail / Apple Mail
+    re.compile(r'^Le .+ a écrit\s*:\s*$', re.DOTALL),
+    re.compile(r'^Am .+ schrieb .+:\s*$', re.DOTALL)
+]
+
+# Lines after which the whole rest of the body is quoted history
+QUOTE_HEADER_PATTERNS = [
+    re.compile(r'^-+\s*Original Message\s*-+\s*$', re.IGNORECASE),
+    re.compile(r'^_{20,}\s*$')                               # Outlook separator
+]
+
+# Forward separators; the forwarded message after them is new to the thread
+# (Gmail "---------- Forwarded message ---------", Apple Mail "Begin forwarded message:")
+FORWARD_PATTERN = re.compile(
+    r'^-*\s*(?:Forwarded message|Begin forwarded message)\s*:?\s*-*\s*$',
+    re.IGNORECASE
+)
+
+# Lines that start a signature block
+SIGNATURE_PATTERNS = [
+    re.compile(r'^--\s*$'),
+    re.compile(r'^Sent from my \w+', re.IGNORECASE),
+    re.compile(r'^Get Outlook for ', re.IGNORECASE)
+]
+
+
+def _is_quote_header(lines, i):
+    """Check whether line i opens an unprefixed quoted history (Outlook style)"""
+    line = lines[i].strip()
+    next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+
+    if any(pattern.match(line) for pattern in QUOTE_HEADER_PATTERNS):
+        return True
+
+    # Outlook header block: "From: ..." directly followed by "Sent:"/"Date:"
+    return line.startswith('From:') and next_line.startswith(('Sent:', 'Date:'))
+
+
+def _attribution_length(lines, i):
+    """Number of lines of an attribution starting at line i, or 0 if there is none
+
+    Only counts when the next non-blank line is ">"-quoted, so prose such as
+    "On the other hand, what you wrote:" stays new content.
+    """
+    line = lines[i].strip()
+    next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+
+    # Gmail wraps long "On ... wrote:" attributions onto a second line
+    for length, candidate in ((1, line), (2, f'{line} {next_line}')):
+        if any(pattern.match(candidate) for pattern in ATTRIBUTION_PATTERNS):
+            following = [rest.strip() for rest in lines[i + length:] if rest.strip()]
+            return length if following and following[0].startswith('>') else 0
+    return 0
+
+
+def split_reply(body):
+    """Split a body into (new_content, quoted_history, signature)
+
+    Handles top-posted, bottom-posted and inline replies: after an
+    attribution only ">"-quoted (and blank) lines are quoted history, and
+    the first unquoted line returns to new content.
+    """
+    lines = (body or '').splitlines()
+    new_lines, quoted_lines, signature_lines = [], [], []
+    in_quote = False
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if FORWARD_PATTERN.match(stripped):
+            # Keep the separator and the forwarded message (including its
+            # From:/Date: header block) as new content
+            new_lines.extend(lines[i:])
+            break
+        if _is_quote_header(lines, i):
+            quoted_lines.extend(lines[i:])
+            break
+
+        length = _attribution_length(lines, i)
+        if length:
+            quoted_lines.extend(lines[i:i + length])
+            in_quote = True
+            i += length
+            continue
+
+        if stripped.startswith('>') or (in_quote and not stripped):
+            # Quoted block, or inline-quoted lines between answers
+            quoted_lines.append(line)
+        else:
+            in_quote = False
+            if signature_lines or any(p.match(stripped) for p in SIGNATURE_PATTERNS):
+                signature_lines.append(line)
+            else:
+                new_lines.append(line)
+        i += 1
+
+    return (
+        '\n'.join(new_lines).strip(),
+        '\n'.join(quoted_lines).strip(),
+        '\n'.join(signature_lines).strip()
+    )
+
+
+def compress_body(body):
+    """Compress a body with zstd when available, falling back to zlib"""
+    raw = (body or '').encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+    return 'zlib', zlib.compress(raw, 9)
+
+
+def decompress_body(codec, data):
+    """Inverse of compress_body"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed bodies")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data)
+    return raw.decode('utf-8')
+
+
+def setup_body_blobs(conn):
+    """Create the deduplicated, compressed store of original bodies"""
+    # Blobs are referenced by the email table that is rebuilt on every
+    # sync, so start them fresh as well
+    conn.execute('DROP TABLE IF EXISTS body_blobs')
+    conn.execute('''
+    CREATE TABLE body_blobs (
+        body_hash TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        raw_size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def store_body(conn, body):
+    """Store the original body once per distinct content; return (new_content, body_hash)"""
+    body = body or ''
+    body_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+    exists = conn.execute(
+        'SELECT 1 FROM body_blobs WHERE body_hash = ?', (body_hash,)
+    ).fetchone()
+    if not exists:
+        codec, data = compress_body(body)
+        conn.execute('''
+        INSERT INTO body_blobs (body_hash, codec, raw_size, data)
+        VALUES (?, ?, ?, ?)
+        ''', (body_hash, codec, len(body.encode('utf-8')), data))
+
+    new_content, _, _ = split_reply(body)
+    return new_content, body_hash
+
+
+def load_original_body(conn, body_hash):
+    """Return the full original body, including quoted history and signature"""
+    row = conn.execute(
+        'SELECT codec, data FROM body_blobs WHERE body_hash = ?', (body_hash,)
+    ).fetchone()
+    if not row:
+        return None
+    return decompress_body(*row)
+
+
+def body_storage_stats(conn, table):
+    """Return (raw_bytes, stored_bytes) of the bodies in an email table"""
+    raw_bytes = conn.execute(f'''
+    SELECT COALESCE(SUM(b.raw_size), 0)
+    FROM {table} e
+    JOIN body_blobs b ON b.body_hash = e.body_hash
+    ''').fetchone()[0]
+    content_bytes = conn.execute(
+        f'SELECT COALESCE(SUM(LENGTH(CAST(body AS BLOB))), 0) FROM {table}'
+    ).fetchone()[0]
+    blob_bytes = conn.execute(
+        'SELECT COALESCE(SUM(LENGTH(data)), 0) FROM body_blobs'
+    ).fetchone()[0]
+    return raw_bytes, content_bytes + blob_bytes
@@ -0,0 +1,377 @@
+import argparse
+import base64
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from body_storage import load_original_body
+from keyword_analysis import top_terms
+from participants import person_volume
+from report_cache import read_watermark
+from subjects import common_topics
+
+# How each email table is listed, ordered and summarised. report_cache is
+# the analytics_cache entry written by the table's analysis script.
+DATASETS = {
+    'innovera_emails': {
+        'report_cache': 'innovera_report_v1',
+        'datetime': "date || ' ' || time",
+        'order': ('date', 'time'),
+        'person': 'recipient',
+        'columns': ('message_id', 'thread_id', 'date', 'time', 'recipient', 'subject', 'direction')
+    },
+    'emails': {
+        'report_cache': 'email_report_v1',
+        'datetime': 'date',
+        'order': ('date',),
+        'person': 'to_email',
+        'columns': ('message_id', 'thread_id', 'date', 'from_email', 'to_email', 'subject', 'direction')
+    }
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Read-only connections shared by all request threads
+CONNECTION_POOL_SIZE = 4
+
+DASHBOARD_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Email Dashboard</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; width: 100%; }
+td, th { border-bottom: 1px solid #ddd; padding: 4px 8px; text-align: left; }
+tr.message { cursor: pointer; }
+pre { white-space: pre-wrap; background: #f6f6f6; padding: 1em; }
+</style>
+</head>
+<body>
+<h1>Email Dashboard</h1>
+<div id="summary"></div>
+<table><thead id="head"></thead><tbody id="messages"></tbody></table>
+<button id="more">Load more</button>
+<pre id="detail"></pre>
+<script>
+let cursor = null;
+const esc = s => String(s ?? '').replace(/[&<>]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;'}[c]));
+fetch('/api/summary').then(r => r.json()).then(s => {
+  document.getElementById('summary').innerHTML =
+    `<p>${s.total} emails from ${esc(s.first)} to ${esc(s.last)}</p>`;
+});
+function loadPage() {
+  fetch('/api/messages' + (cursor ? '?cursor=' + encodeURIComponent(cursor) : ''))
+    .then(r => r.json()).then(page => {
+      if (page.messages.length && !document.getElementById('head').innerHTML) {
+        document.getElementById('head').innerHTML =
+          '<tr>' + Object.keys(page.messages[0]).map(k => `<th>${esc(k)}</th>`).join('') + '</tr>';
+      }
+      for (const m of page.messages) {
+        const row = document.createElement('tr');
+        row.className = 'message';
+        row.innerHTML = Object.values(m).map(v => `<td>${esc(v)}</td>`).join('');
+        row.onclick = () => fetch('/api/messages/' + encodeURIComponent(m.message_id))
+          .then(r => r.json()).then(d => { document.getElementById('detail').textContent = d.body; });
+        document.getElementById('messages').appendChild(row);
+      }
+      cursor = page.next_cursor;
+      document.getElementById('more').disabled = !cursor;
+    });
+}
+document.getElementById('more').onclick = loadPage;
+loadPage();
+</script>
+</body>
+</html>
+'''
+
+
+class DashboardData:
+    """Read-only, cached queries over a synced email database"""
+
+    def __init__(self, db_path, cache_size=256, pool_size=CONNECTION_POOL_SIZE):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        self._version_lock = threading.Lock()
+        self._version_conn = self._connect()
+        self._data_version = None
+        self._epoch = 0
+        self.table = self._detect_table()
+        self.dataset = DATASETS[self.table]
+        # Results are keyed on the sync epoch, so a sync makes every
+        # cached entry unreachable and it ages out of the LRU
+        self._cached = lru_cache(maxsize=cache_size)(self._run)
+
+    def _connect(self):
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @property
+    def conn(self):
+        """Pooled connection borrowed by the query running on this thread"""
+        return self._local.conn
+
+    def _detect_table(self):
+        tables = {row[0] for row in self._version_conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+        for table in DATASETS:
+            if table in tables:
+                return table
+        raise ValueError(f"No email table found in {self.db_path}")
+
+    def epoch(self):
+        """Counter that advances whenever another connection commits (e.g. a sync)"""
+        with self._version_lock:
+            version = self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version:
+                self._data_version = version
+                self._epoch += 1
+            return self._epoch
+
+    def query(self, name, *args):
+        """Run a named query through the LRU cache"""
+        return self._cached(self.epoch(), name, args)
+
+    def _run(self, epoch, name, args):
+        # ThreadingHTTPServer uses a new thread per request, so connections
+        # are borrowed from a fixed pool rather than opened per thread
+        self._local.conn = self._pool.get()
+        try:
+            return getattr(self, f'_query_{name}')(*args)
+        finally:
+            self._pool.put(self._local.conn)
+            del self._local.conn
+
+    def _cached_stats(self):
+        """Report stats persisted by the analysis script, if computed at the current watermark"""
+        try:
+            row = self.conn.execute(
+                'SELECT watermark, stats FROM analytics_cache WHERE name = ?',
+                (self.dataset['report_cache'],)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # No report has been run against this database yet
+            return None
+        if row is None or json.loads(row[0]) != read_watermark(self.conn, self.table):
+            return None
+        return json.loads(row[1])
+
+    def _histogram(self, expression):
+        return dict(self.conn.execute(f'''
+        SELECT {expression} AS bucket, COUNT(*)
+        FROM {self.table}
+        GROUP BY bucket
+        ORDER BY bucket
+        ''').fetchall())
+
+    def _query_summary(self):
+        """Counts, date range and histograms, from the report cache when it is current"""
+        stats = self._cached_stats()
+        if stats is None:
+            return self._summary_from_sql()
+
+        if 'threads' in stats:
+            # email_analysis.py keeps per-thread [first, last, count] and no
+            # recipient histogram
+            threads = stats['threads'].values()
+            total = sum(stats['months'].values())
+            first = str(datetime.fromisoformat(min(t[0] for t in threads))) if threads else None
+            last = str(datetime.fromisoformat(max(t[1] for t in threads))) if threads else None
+            by_person = self._histogram(self.dataset['person'])
+        else:
+            total, first, last = stats['total'], stats['first'], stats['last']
+            by_person = dict(sorted(stats['recipients'].items()))
+
+        return {
+            'total': total,
+            'first': first,
+            'last': last,
+            'by_person': by_person,
+            'by_direction': dict(sorted(stats['directions'].items())),
+            'by_month': dict(sorted(stats['months'].items())),
+            'by_hour': {int(hour): count for hour, count in sorted(
+                stats['hours'].items(), key=lambda item: int(item[0])
+            )}
+        }
+
+    def _summary_from_sql(self):
+        """Summary computed with full scans, when no current report cache exists"""
+        datetime_expr = self.dataset['datetime']
+        total, first, last = self.conn.execute(
+            f'SELECT COUNT(*), MIN({datetime_expr}), MAX({datetime_expr}) FROM {self.table}'
+        ).fetchone()
+
+        return {
+            'total': total,
+            'first': first,
+            'last': last,
+            'by_person': self._histogram(self.dataset['person']),
+            'by_direction': self._histogram('direction'),
+            'by_month': self._histogram(f'substr({datetime_expr}, 1, 7)'),
+            'by_hour': self._histogram(f"CAST(strftime('%H', {datetime_expr}) AS INTEGER)")
+        }
+
+    def _query_topics(self, top_n):
+        return [
+            {'topic': topic, 'count': count}
+            for topic, count in common_topics(self.conn, self.table, top_n)
+        ]
+
+    def _query_participants(self, top_n):
+        return [
+            {'address': address, 'count': count}
+            for address, count in person_volume(self.conn)[:top_n]
+        ]
+
+    def _query_terms(self, top_n, month, direction, recipient):
+        return [
+            {'term': term, 'count': count}
+            for term, count in top_terms(self.conn, self.table, top_n, month, direction, recipient)
+        ]
+
+    def _query_messages(self, cursor, limit):
+        """One page of messages, newest first, using keyset pagination"""
+        order = self.dataset['order'] + ('rowid',)
+        descending = ', '.join(f'{column} DESC' for column in order)
+        columns = ', '.join(('rowid',) + self.dataset['columns'])
+
+        where, params = '', []
+        if cursor:
+            # Row-value comparison seeks straight to the page via the date index
+            where = f"WHERE ({', '.join(order)}) < ({', '.join('?' * len(order))})"
+            params = decode_cursor(cursor, len(order))
+
+        rows = self.conn.execute(f'''
+        SELECT {columns} FROM {self.table}
+        {where}
+        ORDER BY {descending}
+        LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][column] for column in order])
+
+        return {
+            'messages': [{column: row[column] for column in self.dataset['columns']} for row in rows],
+            'next_cursor': next_cursor
+        }
+
+    def _query_message(self, message_id, original):
+        """Full detail of one message; the body is only read here"""
+        row = self.conn.execute(
+            f'SELECT * FROM {self.table} WHERE message_id = ?', (message_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        detail = dict(row)
+        if original and detail.get('body_hash'):
+            detail['body'] = load_original_body(self.conn, detail['body_hash'])
+        return detail
+
+
+def encode_cursor(values):
+    """Opaque pagination token for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, length):
+    """Decode a pagination token, raising ValueError unless it holds length scalars"""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if (
+        not isinstance(values, list)
+        or len(values) != length
+        or not all(isinstance(value, (str, int, float)) for value in values)
+    ):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def parse_limit(params, default, maximum=MAX_PAGE_SIZE):
+    """Read the limit query parameter, clamped to 1..maximum"""
+    return max(1, min(int(params.get('limit', default)), maximum))
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """Serves the dashboard page and its JSON API"""
+
+    data = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        try:
+            if url.path == '/':
+                return self._send(200, DASHBOARD_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/api/summary':
+                result = self.data.query('summary')
+            elif url.path == '/api/topics':
+                result = self.data.query('topics', parse_limit(params, 10))
+            elif url.path == '/api/participants':
+                result = self.data.query('participants', parse_limit(params, 20))
+            elif url.path == '/api/terms':
+                result = self.data.query(
+                    'terms',
+                    parse_limit(params, 20),
+                    params.get('month'),
+                    params.get('direction'),
+                    params.get('recipient')
+                )
+            elif url.path == '/api/messages':
+                limit = parse_limit(params, DEFAULT_PAGE_SIZE)
+                result = self.data.query('messages', params.get('cursor'), limit)
+            elif url.path.startswith('/api/messages/'):
+                message_id = unquote(url.path[len('/api/messages/'):])
+                result = self.data.query('message', message_id, params.get('original') == '1')
+                if result is None:
+                    return self._send_json(404, {'error': 'message not found'})
+            else:
+                return self._send_json(404, {'error': 'not found'})
+        except (ValueError, sqlite3.OperationalError) as e:
+            return self._send_json(400, {'error': str(e)})
+
+        self._send_json(200, result)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, default=str).encode('utf-8'), 'application/json')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a read-only dashboard over a synced email database")
+    parser.add_argument('--db', default='innovera_domain_emails.db', help="SQLite database to serve")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    args = parser.parse_args()
+
+    DashboardHandler.data = DashboardData(args.db)
+    server = ThreadingHTTPServer((args.host, args.port), DashboardHandler)
+    print(f"Serving {args.db} ({DashboardHandler.data.table}) at http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down dashboard.")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -6,55 +6,160 @@ from collections import defaultdict
 import re
 from wordcloud import WordCloud
 
+from keyword_analysis import KeywordIndex
+from parallel_analysis import ParallelAggregator, merge_counts
+from report_cache import ReportCache
+from subjects import NO_SUBJECT_KEY, common_topics, normalize_subject, representative_subject
+
 class EmailAnalyzer:
-    def __init__(self, db_path='innovera_emails.db'):
+    # Bump when the layout of the cached stats changes
+    REPORT_CACHE_NAME = 'email_report_v1'
+    STATS_COLUMNS = ['thread_id', 'date', 'direction']
+
+    def __init__(self, db_path='innovera_emails.db', workers=None):
+        self.db_path = db_path
+        self.workers = workers
         self.conn = sqlite3.connect(db_path)
-        # Convert database rows directly to pandas DataFrame
-        self.df = pd.read_sql_query("""
-            SELECT * FROM emails
-            ORDER BY date ASC
-        """, self.conn)
-        # Convert date string to datetime
-        self.df['date'] = pd.to_datetime(self.df['date'])
+        self.cache = ReportCache(self.conn)
+        self._df = None
+
+    @property
+    def df(self):
+        """Full emails DataFrame, loaded on first use"""
+        if self._df is None:
+            # Convert database rows directly to pandas DataFrame
+            self._df = pd.read_sql_query("""
+                SELECT * FROM emails
+                ORDER BY date ASC
+            """, self.conn)
+            # Convert date string to datetime
+            self._df['date'] = pd.to_datetime(self._df['date'])
+        return self._df
+
+    @staticmethod
+    def _new_stats():
+        """Empty report stats; every field is mergeable across row batches"""
+        return {
+            'threads': {},
+            'months': {},
+            'years': {},
+            'hours': {},
+            'directions': {}
+        }
+
+    @staticmethod
+    def _accumulate_stats(stats, rows):
+        """Fold (thread_id, date, direction) rows into the report stats"""
+        for thread_id, date, direction in rows:
+            date = datetime.fromisoformat(date)
+            iso_date = date.isoformat()
+
+            # Per-thread first/last date and message count. Consecutive gaps
+            # within a thread sum to last - first, so this is all the
+            # average response time needs.
+            thread = stats['threads'].get(thread_id)
+            if thread is None:
+                stats['threads'][thread_id] = [iso_date, iso_date, 1]
+            else:
+                thread[0] = min(thread[0], iso_date)
+                thread[1] = max(thread[1], iso_date)
+                thread[2] += 1
+
+            for field, key in (
+                ('months', date.strftime('%Y-%m')),
+                ('years', str(date.year)),
+                ('hours', str(date.hour)),
+                ('directions', direction)
+            ):
+                stats[field][key] = stats[field].get(key, 0) + 1
+
+    @staticmethod
+    def _merge_stats(stats, partial):
+        """Merge stats computed over another partition into stats"""
+        for thread_id, (first, last, count) in partial['threads'].items():
+            thread = stats['threads'].get(thread_id)
+            if thread is None:
+                stats['threads'][thread_id] = [first, last, count]
+            else:
+                thread[0] = min(thread[0], first)
+                thread[1] = max(thread[1], last)
+                thread[2] += count
+        for field in ('months', 'years', 'hours', 'directions'):
+            merge_counts(stats[field], partial[field])
+
+    def _load_stats(self):
+        """Report stats, served from the cache when nothing new was synced"""
+        return self.cache.get_stats(
+            self.REPORT_CACHE_NAME,
+            'emails',
+            self.STATS_COLUMNS,
+            self._new_stats,
+            self._accumulate_stats,
+            full_scan=ParallelAggregator(
+                self.db_path, 'emails', self.STATS_COLUMNS, self._new_stats,
+                self._accumulate_stats, self._merge_stats, self.workers
+            ).run
+        )
 
     def get_basic_stats(self):
         """Get basic statistics about email communication"""
+        report_stats = self._load_stats()
         stats = {
-            'total_threads': self.df['thread_id'].nunique(),
-            'avg_response_time': self._calculate_avg_response_time(),
-            'busiest_month': self._get_busiest_month(),
+            'total_threads': len(report_stats['threads']),
+            'avg_response_time': self._calculate_avg_response_time(report_stats),
+            'busiest_month': self._get_busiest_month(report_stats),
             'common_subjects': self._get_common_subjects(),
-            'email_volume_by_year': self._get_volume_by_year()
+            'email_volume_by_year': self._get_volume_by_year(report_stats),
+            'peak_hour': self._get_peak_hour(report_stats)
         }
         return stats
 
-    def _calculate_avg_response_time(self):
+    def _calculate_avg_response_time(self, report_stats):
         """Calculate average response time within threads"""
-        response_times = []
-        for thread_id in self.df['thread_id'].unique():
-            thread_msgs = self.df[self.df['thread_id'] == thread_id].sort_values('date')
-            if len(thread_msgs) > 1:
-                time_diffs = thread_msgs['date'].diff()
-                response_times.extend(time_diffs.dropna().dt.total_seconds() / 3600)  # Convert to hours
-        
-        if response_times:
-            return sum(response_times) / len(response_times)
+        total_hours = 0
+        response_count = 0
+        for first, last, count in report_stats['threads'].values():
+            if count > 1:
+                span = datetime.fromisoformat(last) - datetime.fromisoformat(first)
+                total_hours += span.total_seconds() / 3600  # Convert to hours
+                response_count += count - 1
+
+        if response_count:
+            return total_hours / response_count
         return 0
 
-    def _get_busiest_month(self):
+    def _get_busiest_month(self, report_stats):
         """Find the month with most email activity"""
-        monthly_counts = self.df.groupby(self.df['date'].dt.strftime('%Y-%m')).size()
-        return monthly_counts.idxmax(), monthly_counts.max()
+        monthly_counts = report_stats['months']
+        # Earliest month wins ties
+        busiest = min(monthly_counts, key=lambda month: (-monthly_counts[month], month))
+        return busiest, monthly_counts[busiest]
 
     def _get_common_subjects(self, top_n=5):
-        """Get most common email subject patterns"""
-        # Remove Re:, Fwd:, etc. and group similar subjects
-        cleaned_subjects = self.df['subject'].str.replace(r'^(Re|Fwd|FW|RE):\s*', '', regex=True)
-        return cleaned_subjects.value_counts().head(top_n).to_dict()
+        """Get most common topics, shown by a representative subject, from the subject_key index"""
+        try:
+            return dict(common_topics(self.conn, 'emails', top_n))
+        except sqlite3.OperationalError:
+            # Database synced before subject_key existed: normalize the raw
+            # subjects instead (re-run email_sync.py to use the index)
+            print("No subject_key column - re-run email_sync.py for indexed topics")
+            topics = defaultdict(list)
+            for subject, in self.conn.execute('SELECT subject FROM emails'):
+                topics[normalize_subject(subject)].append(subject or '')
+            top = sorted(topics.items(), key=lambda item: (-len(item[1]), item[0]))[:top_n]
+            return {
+                key if key == NO_SUBJECT_KEY else representative_subject(subjects): len(subjects)
+                for key, subjects in top
+            }
 
-    def _get_volume_by_year(self):
+    def _get_volume_by_year(self, report_stats):
         """Get email volume by year"""
-        return self.df.groupby(self.df['date'].dt.year).size().to_dict()
+        return {int(year): count for year, count in sorted(report_stats['years'].items())}
+
+    def _get_peak_hour(self, report_stats):
+        """Get the busiest hour of the day, earliest hour winning ties"""
+        hour_distribution = report_stats['hours']
+        return int(min(hour_distribution, key=lambda hour: (-hour_distribution[hour], int(hour))))
 
     def generate_insights_report(self):
         """Generate a comprehensive insights report"""
@@ -82,34 +187,69 @@ Communication Patterns:
             report += f"  - {subject}: {count} occurrences\n"
 
         # Add time analysis
-        hour_distribution = self.df['date'].dt.hour.value_counts().sort_index()
-        peak_hour = hour_distribution.idxmax()
         report += f"\nTime Analysis:\n-------------\n"
-        report += f"• Peak activity hour: {peak_hour}:00"
+        report += f"• Peak activity hour: {stats['peak_hour']}:00"
+
+        return report
 
+    def get_top_terms(self, top_n=20, **filters):
+        """Most frequent terms from the incremental keyword index"""
+        keywords = KeywordIndex(self.conn, 'emails')
+        keywords.update()
+        return keywords.top_terms(top_n, **filters)
+
+    def generate_keyword_report(self, top_n=20):
+        """Generate a report of the most used terms overall and per direction"""
+        report = "\nKeyword Analysis:\n----------------\n"
+        for term, count in self.get_top_terms(top_n):
+            report += f"  - {term}: {count}\n"
+        for direction in ('to_work', 'to_personal'):
+            terms = self.get_top_terms(5, direction=direction)
+            if terms:
+                report += f"• Top terms {direction}: {', '.join(term for term, _ in terms)}\n"
         return report
 
+    def plot_word_cloud(self, max_words=200):
+        """Render the keyword index as a word cloud image"""
+        frequencies = dict(self.get_top_terms(max_words))
+        if not frequencies:
+            return False
+        cloud = WordCloud(width=1600, height=800, background_color='white', max_words=max_words)
+        cloud.generate_from_frequencies(frequencies)
+        cloud.to_file('email_wordcloud.png')
+        return True
+
     def plot_email_patterns(self):
         """Generate visualizations of email patterns"""
+        stats = self._load_stats()
+        
         # Create subplots
         fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
         
         # 1. Email volume over time
-        self.df.resample('M', on='date').size().plot(ax=ax1, title='Email Volume Over Time')
+        monthly_counts = pd.Series(stats['months'], dtype='int64')
+        monthly_counts.index = pd.to_datetime(monthly_counts.index)
+        monthly_counts.sort_index().resample('M').sum().plot(ax=ax1, title='Email Volume Over Time')
         ax1.set_xlabel('Date')
         ax1.set_ylabel('Number of Emails')
         
         # 2. Email direction distribution
-        self.df['direction'].value_counts().plot(kind='pie', ax=ax2, title='Email Direction Distribution')
+        pd.Series(stats['directions']).sort_values(ascending=False).plot(
+            kind='pie', ax=ax2, title='Email Direction Distribution')
         
         # 3. Hourly distribution
-        self.df['date'].dt.hour.value_counts().sort_index().plot(
+        hourly_counts = pd.Series({int(hour): count for hour, count in stats['hours'].items()})
+        hourly_counts.sort_index().plot(
             kind='bar', ax=ax3, title='Email Activity by Hour')
         ax3.set_xlabel('Hour of Day')
         ax3.set_ylabel('Number of Emails')
         
         # 4. Monthly distribution
-        self.df['date'].dt.month.value_counts().sort_index().plot(
+        month_of_year_counts = {}
+        for month, count in stats['months'].items():
+            month_of_year = int(month[5:7])
+            month_of_year_counts[month_of_year] = month_of_year_counts.get(month_of_year, 0) + count
+        pd.Series(month_of_year_counts).sort_index().plot(
             kind='bar', ax=ax4, title='Email Activity by Month')
         ax4.set_xlabel('Month')
         ax4.set_ylabel('Number of Emails')
@@ -124,9 +264,14 @@ def main():
     # Generate and print insights report
     print(analyzer.generate_insights_report())
     
+    print(analyzer.generate_keyword_report())
+    
     # Generate visualizations
     analyzer.plot_email_patterns()
     print("\nVisualizations have been saved to 'email_patterns.png'")
+    
+    if analyzer.plot_word_cloud():
+        print("Word cloud has been saved to 'email_wordcloud.png'")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,7 +7,15 @@ import sqlite3
 from datetime import datetime
 import json
 import base64
-from email.utils import parseaddr
+from time import perf_counter
+
+from body_storage import body_storage_stats, setup_body_blobs, store_body
+from keyword_analysis import update_keyword_index
+from participants import (
+    addresses_for_role, extract_participants, setup_participants, store_participants
+)
+from report_cache import bump_generation, get_sync_value, install_deletion_trigger, set_sync_value
+from subjects import create_subject_index, normalize_subject
 
 class EmailSync:
     def __init__(self):
@@ -23,6 +31,8 @@ class EmailSync:
         
         # Drop existing table to start fresh
         self.cursor.execute('DROP TABLE IF EXISTS emails')
+        # Invalidate any analytics cached against the old table
+        bump_generation(self.conn, 'emails')
         
         # Create emails table
         self.cursor.execute('''
@@ -30,14 +40,23 @@ class EmailSync:
             message_id TEXT PRIMARY KEY,
             thread_id TEXT,
             subject TEXT,
+            subject_key TEXT,
             from_email TEXT,
             to_email TEXT,
             date TIMESTAMP,
             body TEXT,
+            body_hash TEXT,
             direction TEXT
         )
         ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_date ON emails (date)')
         self.conn.commit()
+        
+        create_subject_index(self.conn, 'emails')
+        install_deletion_trigger(self.conn, 'emails')
+        
+        setup_participants(self.conn)
+        setup_body_blobs(self.conn)
 
     def authenticate(self):
         """Handle Gmail OAuth authentication"""
@@ -85,12 +104,13 @@ class EmailSync:
             
             headers = message['payload']['headers']
             subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-            from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), '')
-            to_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), '')
             
-            # Clean and extract email addresses
-            from_email = parseaddr(from_email)[1].lower()
-            to_email = parseaddr(to_email)[1].lower()
+            # Parse every From/To/Cc/Reply-To address
+            participants = extract_participants(headers)
+            from_addresses = addresses_for_role(participants, 'from')
+            to_addresses = addresses_for_role(participants, 'to')
+            from_email = from_addresses[0] if from_addresses else ''
+            to_email = to_addresses[0] if to_addresses else ''
             
             # Strict filtering: Only process if it's directly between our two addresses
             if not (
@@ -109,11 +129,13 @@ class EmailSync:
                 'message_id': message_id,
                 'thread_id': message['threadId'],
                 'subject': subject,
+                'subject_key': normalize_subject(subject),
                 'from_email': from_email,
                 'to_email': to_email,
                 'date': date,
                 'body': body,
-                'direction': direction
+                'direction': direction,
+                'participants': participants
             }
         except Exception as e:
             print(f"Error processing message {message_id}: {e}")
@@ -124,20 +146,27 @@ class EmailSync:
         if not email_data:
             return
             
+        # Keep only the new content inline; the full original is stored
+        # compressed and deduplicated in body_blobs
+        body, body_hash = store_body(self.conn, email_data['body'])
+        
         self.cursor.execute('''
         INSERT OR REPLACE INTO emails 
-        (message_id, thread_id, subject, from_email, to_email, date, body, direction)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        (message_id, thread_id, subject, subject_key, from_email, to_email, date, body, body_hash, direction)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             email_data['message_id'],
             email_data['thread_id'],
             email_data['subject'],
+            email_data['subject_key'],
             email_data['from_email'],
             email_data['to_email'],
             email_data['date'],
-            email_data['body'],
+            body,
+            body_hash,
             email_data['direction']
         ))
+        store_participants(self.conn, email_data['message_id'], email_data['participants'])
         self.conn.commit()
 
     def sync_emails(self):
@@ -159,6 +188,7 @@ class EmailSync:
                 
             total_messages = len(messages)
             print(f"Found {total_messages} messages to process...")
+            start_time = perf_counter()
             
             for message in messages:
                 email_data = self.process_message(message['id'])
@@ -167,8 +197,14 @@ class EmailSync:
                     processed_count += 1
                     print(f"Processed {processed_count}/{total_messages} emails...")
             
+            elapsed = perf_counter() - start_time
+            
             print(f"\nSync completed! Processed {processed_count} emails.")
             self.print_stats()
+            self.print_storage_stats(processed_count, elapsed)
+            
+            indexed = update_keyword_index(self.conn, 'emails')
+            print(f"Keyword index updated with {indexed} emails.")
             
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -193,6 +229,39 @@ class EmailSync:
         if stats[0] > 0:
             print(f"Date range: {stats[3]} to {stats[4]}")
 
+    def print_storage_stats(self, processed_count, elapsed):
+        """Print body storage savings, database growth and sync throughput vs the previous sync"""
+        raw_bytes, stored_bytes = body_storage_stats(self.conn, 'emails')
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        used_pages = (
+            self.conn.execute('PRAGMA page_count').fetchone()[0] -
+            self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        )
+        db_bytes = used_pages * page_size
+        
+        print("\nStorage Statistics:")
+        print(f"Database size: {db_bytes / 1024:.1f} KB"
+              f"{self._change('emails_db_bytes', db_bytes, 'KB', 1024)}")
+        if raw_bytes > 0:
+            ratio = 100 * (stored_bytes / raw_bytes - 1)
+            print(f"Body storage: {raw_bytes / 1024:.1f} KB raw -> {stored_bytes / 1024:.1f} KB stored, "
+                  f"{abs(ratio):.1f}% {'larger' if ratio > 0 else 'smaller'} than raw"
+                  f"{self._change('emails_body_bytes', stored_bytes, 'KB', 1024)}")
+        
+        if elapsed > 0:
+            throughput = processed_count / elapsed
+            print(f"Throughput: {throughput:.1f} emails/sec"
+                  f"{self._change('emails_sync_throughput', throughput, 'emails/sec')}")
+
+    def _change(self, key, value, unit, scale=1):
+        """Describe the change from the value recorded by the previous sync, then record this one"""
+        previous = get_sync_value(self.conn, key)
+        set_sync_value(self.conn, key, value)
+        if not previous:
+            return ''
+        change = 100 * (value / previous - 1)
+        return f" ({change:+.1f}% vs previous sync at {previous / scale:.1f} {unit})"
+
 def main():
     syncer = EmailSync()
     syncer.authenticate()
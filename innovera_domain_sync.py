@@ -7,9 +7,17 @@ import sqlite3
 from datetime import datetime
 import json
 import base64
-from email.utils import parseaddr
+from time import perf_counter
 import re
 
+from body_storage import body_storage_stats, setup_body_blobs, store_body
+from keyword_analysis import update_keyword_index
+from participants import (
+    addresses_for_role, extract_participants, setup_participants, store_participants
+)
+from report_cache import bump_generation, get_sync_value, install_deletion_trigger, set_sync_value
+from subjects import create_subject_index, normalize_subject
+
 class InnoveraEmailSync:
     def __init__(self):
         self.SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
@@ -24,20 +32,33 @@ class InnoveraEmailSync:
         
         # Drop existing table to start fresh
         self.cursor.execute('DROP TABLE IF EXISTS innovera_emails')
+        # Invalidate any analytics cached against the old table
+        bump_generation(self.conn, 'innovera_emails')
         
         # Create emails table with recipient column
         self.cursor.execute('''
         CREATE TABLE IF NOT EXISTS innovera_emails (
             message_id TEXT PRIMARY KEY,
+            thread_id TEXT,
             recipient TEXT,
             date DATE,
             time TIME,
             subject TEXT,
+            subject_key TEXT,
             body TEXT,
+            body_hash TEXT,
             direction TEXT
         )
         ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_innovera_emails_thread ON innovera_emails (thread_id)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_innovera_emails_date ON innovera_emails (date, time)')
         self.conn.commit()
+        
+        create_subject_index(self.conn, 'innovera_emails')
+        install_deletion_trigger(self.conn, 'innovera_emails')
+        
+        setup_participants(self.conn)
+        setup_body_blobs(self.conn)
 
     def authenticate(self):
         """Handle Gmail OAuth authentication"""
@@ -84,21 +105,22 @@ class InnoveraEmailSync:
             
             headers = message['payload']['headers']
             subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-            from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), '')
-            to_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), '')
             
-            # Clean and extract email addresses
-            from_email = parseaddr(from_email)[1].lower()
-            to_email = parseaddr(to_email)[1].lower()
+            # Parse every From/To/Cc/Reply-To address
+            participants = extract_participants(headers)
+            from_addresses = addresses_for_role(participants, 'from')
+            from_email = from_addresses[0] if from_addresses else ''
+            recipients = addresses_for_role(participants, 'to') + addresses_for_role(participants, 'cc')
+            innovera_recipients = [r for r in recipients if self.INNOVERA_DOMAIN in r]
             
             # Determine if this is a relevant email and get the innovera recipient
             innovera_recipient = None
             direction = None
             
-            if from_email == self.PERSONAL_EMAIL and self.INNOVERA_DOMAIN in to_email:
-                innovera_recipient = to_email
+            if from_email == self.PERSONAL_EMAIL and innovera_recipients:
+                innovera_recipient = innovera_recipients[0]
                 direction = 'outbound'
-            elif self.INNOVERA_DOMAIN in from_email and to_email == self.PERSONAL_EMAIL:
+            elif self.INNOVERA_DOMAIN in from_email and self.PERSONAL_EMAIL in recipients:
                 innovera_recipient = from_email
                 direction = 'inbound'
             else:
@@ -113,12 +135,15 @@ class InnoveraEmailSync:
             
             return {
                 'message_id': message_id,
+                'thread_id': message['threadId'],
                 'recipient': innovera_recipient,
                 'date': date,
                 'time': time,
                 'subject': subject,
+                'subject_key': normalize_subject(subject),
                 'body': body,
-                'direction': direction
+                'direction': direction,
+                'participants': participants
             }
         except Exception as e:
             print(f"Error processing message {message_id}: {e}")
@@ -129,19 +154,27 @@ class InnoveraEmailSync:
         if not email_data:
             return
             
+        # Keep only the new content inline; the full original is stored
+        # compressed and deduplicated in body_blobs
+        body, body_hash = store_body(self.conn, email_data['body'])
+        
         self.cursor.execute('''
         INSERT OR REPLACE INTO innovera_emails 
-        (message_id, recipient, date, time, subject, body, direction)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        (message_id, thread_id, recipient, date, time, subject, subject_key, body, body_hash, direction)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             email_data['message_id'],
+            email_data['thread_id'],
             email_data['recipient'],
             email_data['date'],
             email_data['time'],
             email_data['subject'],
-            email_data['body'],
+            email_data['subject_key'],
+            body,
+            body_hash,
             email_data['direction']
         ))
+        store_participants(self.conn, email_data['message_id'], email_data['participants'])
         self.conn.commit()
 
     def sync_emails(self):
@@ -163,6 +196,7 @@ class InnoveraEmailSync:
                 
             total_messages = len(messages)
             print(f"Found {total_messages} messages to process...")
+            start_time = perf_counter()
             
             # Track unique recipients
             recipients = set()
@@ -175,12 +209,18 @@ class InnoveraEmailSync:
                     processed_count += 1
                     print(f"Processed {processed_count}/{total_messages} emails...")
             
+            elapsed = perf_counter() - start_time
+            
             print(f"\nSync completed! Processed {processed_count} emails.")
             print("\nUnique Innovera recipients found:")
             for recipient in sorted(recipients):
                 print(f"- {recipient}")
             
             self.print_stats()
+            self.print_storage_stats(processed_count, elapsed)
+            
+            indexed = update_keyword_index(self.conn, 'innovera_emails')
+            print(f"Keyword index updated with {indexed} emails.")
             
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -215,6 +255,39 @@ class InnoveraEmailSync:
         for recipient, count in self.cursor.fetchall():
             print(f"- {recipient}: {count} emails")
 
+    def print_storage_stats(self, processed_count, elapsed):
+        """Print body storage savings, database growth and sync throughput vs the previous sync"""
+        raw_bytes, stored_bytes = body_storage_stats(self.conn, 'innovera_emails')
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        used_pages = (
+            self.conn.execute('PRAGMA page_count').fetchone()[0] -
+            self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        )
+        db_bytes = used_pages * page_size
+        
+        print("\nStorage Statistics:")
+        print(f"Database size: {db_bytes / 1024:.1f} KB"
+              f"{self._change('innovera_emails_db_bytes', db_bytes, 'KB', 1024)}")
+        if raw_bytes > 0:
+            ratio = 100 * (stored_bytes / raw_bytes - 1)
+            print(f"Body storage: {raw_bytes / 1024:.1f} KB raw -> {stored_bytes / 1024:.1f} KB stored, "
+                  f"{abs(ratio):.1f}% {'larger' if ratio > 0 else 'smaller'} than raw"
+                  f"{self._change('innovera_emails_body_bytes', stored_bytes, 'KB', 1024)}")
+        
+        if elapsed > 0:
+            throughput = processed_count / elapsed
+            print(f"Throughput: {throughput:.1f} emails/sec"
+                  f"{self._change('innovera_emails_sync_throughput', throughput, 'emails/sec')}")
+
+    def _change(self, key, value, unit, scale=1):
+        """Describe the change from the value recorded by the previous sync, then record this one"""
+        previous = get_sync_value(self.conn, key)
+        set_sync_value(self.conn, key, value)
+        if not previous:
+            return ''
+        change = 100 * (value / previous - 1)
+        return f" ({change:+.1f}% vs previous sync at {previous / scale:.1f} {unit})"
+
 def main():
     syncer = InnoveraEmailSync()
     syncer.authenticate()
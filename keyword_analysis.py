@@ -0,0 +1,205 @@
+import re
+import sqlite3
+
+from report_cache import get_sync_value, read_watermark, set_sync_value
+
+# Common English words and mail boilerplate that carry no topic signal
+STOPWORDS = frozenset('''
+a about above after again against all also am an and any are as at be because
+been before being below between both but by can could did do does doing done
+down during each few for from further get got had has have having he her here
+hers herself him himself his how i if in into is it its itself just know let
+like me more most my myself no nor not now of off on once only or other our
+ours ourselves out over own same she should so some such than thank thanks that
+the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why
+will with would you your yours yourself yourselves
+am pm re fw fwd sent cc bcc subject wrote regards best cheers hi hello dear
+please see also one two via www http https com
+'''.split())
+
+URL_PATTERN = re.compile(r'(?:https?://|www\.)\S+|\S+@\S+')
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9']+")
+
+# Columns giving the month, direction and recipient dimensions of each table
+DIMENSIONS = {
+    'emails': ('substr(date, 1, 7)', 'direction', 'to_email'),
+    'innovera_emails': ('substr(date, 1, 7)', 'direction', 'recipient')
+}
+
+
+def tokenize(text):
+    """Lowercased content words, skipping quoted lines, URLs and stopwords"""
+    lines = [line for line in (text or '').splitlines() if not line.lstrip().startswith('>')]
+    text = URL_PATTERN.sub(' ', '\n'.join(lines).lower())
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.strip("'")
+        if token.endswith("'s"):
+            token = token[:-2]
+        if len(token) > 2 and token not in STOPWORDS and not token.isdigit():
+            yield token
+
+
+class KeywordIndex:
+    """Incremental term counts per month, direction and recipient"""
+
+    def __init__(self, conn, table, chunk_size=2000):
+        self.conn = conn
+        self.table = table
+        self.chunk_size = chunk_size
+        self.setup_tables()
+
+    def setup_tables(self):
+        """Create the interned terms table and sparse term_counts store"""
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS terms (
+            term_id INTEGER PRIMARY KEY,
+            term TEXT UNIQUE NOT NULL
+        )
+        ''')
+        # Only non-zero (term, month, direction, recipient) cells are stored,
+        # separately for each source email table
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS term_counts (
+            source TEXT NOT NULL,
+            term_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            direction TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (source, term_id, month, direction, recipient)
+        ) WITHOUT ROWID
+        ''')
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_term_counts_slice
+        ON term_counts (source, month, direction, recipient)
+        ''')
+        self.conn.commit()
+
+    def _state_key(self, name):
+        return f'{self.table}_keywords_{name}'
+
+    def _reset(self, watermark):
+        """Discard this table's counts, e.g. after the email table was rebuilt"""
+        self.conn.execute('DELETE FROM term_counts WHERE source = ?', (self.table,))
+        self.conn.execute('''
+        DELETE FROM terms
+        WHERE term_id NOT IN (SELECT DISTINCT term_id FROM term_counts)
+        ''')
+        self.conn.commit()
+        set_sync_value(self.conn, self._state_key('generation'), watermark['generation'])
+        set_sync_value(self.conn, self._state_key('deletions'), watermark['deletions'])
+        set_sync_value(self.conn, self._state_key('rowid'), 0)
+        set_sync_value(self.conn, self._state_key('rows'), 0)
+
+    def update(self):
+        """Fold bodies synced since the last update into the term counts
+
+        Bodies are streamed in chunks of chunk_size rows and each chunk's
+        counts are merged in SQL, so memory stays bounded by the chunk
+        rather than the corpus. Returns the number of emails processed.
+        """
+        watermark = read_watermark(self.conn, self.table)
+        generation = get_sync_value(self.conn, self._state_key('generation'))
+        deletions = get_sync_value(self.conn, self._state_key('deletions'))
+        last_rowid = get_sync_value(self.conn, self._state_key('rowid'), 0)
+        processed_rows = get_sync_value(self.conn, self._state_key('rows'), 0)
+
+        # Table rebuilt, or rows replaced or deleted since the last update
+        # (counted by the deletion trigger): start over
+        if generation != watermark['generation'] or deletions != watermark['deletions']:
+            self._reset(watermark)
+            last_rowid, processed_rows = 0, 0
+
+        month, direction, recipient = DIMENSIONS[self.table]
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+        SELECT rowid, {month}, COALESCE({direction}, ''), COALESCE({recipient}, ''), body
+        FROM {self.table}
+        WHERE rowid > ? AND rowid <= ?
+        ORDER BY rowid
+        ''', (last_rowid, watermark['max_rowid']))
+
+        processed = 0
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+
+            counts = {}
+            for _, row_month, row_direction, row_recipient, body in rows:
+                for term in tokenize(body):
+                    key = (term, row_month, row_direction, row_recipient)
+                    counts[key] = counts.get(key, 0) + 1
+
+            self._merge_counts(counts)
+            processed += len(rows)
+            # Watermark and counts are committed together so an
+            # interrupted update resumes from the last full chunk
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?), (?, ?)',
+                (self._state_key('rowid'), rows[-1][0],
+                 self._state_key('rows'), processed_rows + processed)
+            )
+            self.conn.commit()
+
+        return processed
+
+    def _merge_counts(self, counts):
+        """Add one chunk of (term, month, direction, recipient) counts"""
+        self.conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS term_count_batch (
+            term TEXT, month TEXT, direction TEXT, recipient TEXT, count INTEGER
+        )
+        ''')
+        self.conn.executemany(
+            'INSERT INTO term_count_batch VALUES (?, ?, ?, ?, ?)',
+            [key + (count,) for key, count in counts.items()]
+        )
+        self.conn.execute('''
+        INSERT OR IGNORE INTO terms (term)
+        SELECT DISTINCT term FROM term_count_batch
+        ''')
+        self.conn.execute('''
+        INSERT INTO term_counts (source, term_id, month, direction, recipient, count)
+        SELECT ?, t.term_id, b.month, b.direction, b.recipient, b.count
+        FROM term_count_batch b
+        JOIN terms t ON t.term = b.term
+        WHERE true
+        ON CONFLICT (source, term_id, month, direction, recipient)
+        DO UPDATE SET count = count + excluded.count
+        ''', (self.table,))
+        self.conn.execute('DELETE FROM term_count_batch')
+
+    def top_terms(self, top_n=20, month=None, direction=None, recipient=None):
+        """Most frequent terms, optionally restricted to a month/direction/recipient"""
+        return top_terms(self.conn, self.table, top_n, month, direction, recipient)
+
+
+def update_keyword_index(conn, table):
+    """Bring the keyword index of an email table up to date"""
+    try:
+        return KeywordIndex(conn, table).update()
+    except sqlite3.OperationalError as e:
+        print(f"Could not update keyword index: {e}")
+        return 0
+
+
+def top_terms(conn, table, top_n=20, month=None, direction=None, recipient=None):
+    """Query the keyword index of an email table without modifying the database"""
+    filters, params = ['c.source = ?'], [table]
+    for column, value in (('month', month), ('direction', direction), ('recipient', recipient)):
+        if value is not None:
+            filters.append(f'c.{column} = ?')
+            params.append(value)
+    where = f"WHERE {' AND '.join(filters)}"
+
+    return conn.execute(f'''
+    SELECT t.term, SUM(c.count) AS total
+    FROM term_counts c
+    JOIN terms t ON t.term_id = c.term_id
+    {where}
+    GROUP BY c.term_id
+    ORDER BY total DESC, t.term
+    LIMIT ?
+    ''', params + [top_n]).fetchall()
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+# Below this many rows process start-up costs more than it saves
+PARALLEL_MIN_ROWS = 20000
+
+# Partitions per worker, so one slow range does not leave cores idle
+PARTITIONS_PER_WORKER = 4
+
+
+def rowid_partitions(min_rowid, max_rowid, partitions):
+    """Split [min_rowid, max_rowid] into contiguous, non-overlapping ranges"""
+    if max_rowid < min_rowid:
+        return []
+    span = max_rowid - min_rowid + 1
+    partitions = max(1, min(partitions, span))
+    step = -(-span // partitions)  # ceiling division
+    return [
+        (lo, min(lo + step - 1, max_rowid))
+        for lo in range(min_rowid, max_rowid + 1, step)
+    ]
+
+
+def aggregate_partition(db_path, table, columns, new_stats, accumulate, lo, hi):
+    """Compute partial stats for one rowid range straight from SQLite (runs in a worker)"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        stats = new_stats()
+        accumulate(stats, conn.execute(
+            f'SELECT {", ".join(columns)} FROM {table} WHERE rowid BETWEEN ? AND ?',
+            (lo, hi)
+        ))
+        return stats
+    finally:
+        conn.close()
+
+
+class ParallelAggregator:
+    """Partition an email table by rowid range and aggregate it across cores
+
+    new_stats, accumulate and merge must be module-level or static
+    functions so they can be sent to worker processes.
+    """
+
+    def __init__(self, db_path, table, columns, new_stats, accumulate, merge, workers=None):
+        self.db_path = db_path
+        self.table = table
+        self.columns = columns
+        self.new_stats = new_stats
+        self.accumulate = accumulate
+        self.merge = merge
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, max_rowid):
+        """Return stats over all rows with rowid <= max_rowid"""
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        try:
+            min_rowid, row_count = conn.execute(
+                f'SELECT COALESCE(MIN(rowid), 1), COUNT(*) FROM {self.table} WHERE rowid <= ?',
+                (max_rowid,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        ranges = rowid_partitions(min_rowid, max_rowid, self.workers * PARTITIONS_PER_WORKER)
+        if self.workers == 1 or row_count < PARALLEL_MIN_ROWS:
+            ranges = [(min_rowid, max_rowid)]
+            partials = [
+                aggregate_partition(self.db_path, self.table, self.columns,
+                                    self.new_stats, self.accumulate, lo, hi)
+                for lo, hi in ranges
+            ]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    pool.submit(aggregate_partition, self.db_path, self.table, self.columns,
+                                self.new_stats, self.accumulate, lo, hi)
+                    for lo, hi in ranges
+                ]
+                partials = [future.result() for future in futures]
+
+        stats = self.new_stats()
+        for partial in partials:
+            self.merge(stats, partial)
+        return stats
+
+
+def merge_counts(target, source):
+    """Add the counts of one histogram dict into another"""
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
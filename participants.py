@@ -0,0 +1,123 @@
+from email.utils import getaddresses
+
+# Headers parsed into the participants table, mapped to their stored role
+PARTICIPANT_HEADERS = {
+    'from': 'from',
+    'to': 'to',
+    'cc': 'cc',
+    'reply-to': 'reply_to'
+}
+
+
+def setup_participants(conn):
+    """Create the interned addresses table and normalized participants table"""
+    # Participants reference message_ids of the email table that is rebuilt
+    # on every sync, so start them fresh as well
+    conn.execute('DROP TABLE IF EXISTS participants')
+    conn.execute('DROP TABLE IF EXISTS addresses')
+
+    conn.execute('''
+    CREATE TABLE addresses (
+        address_id INTEGER PRIMARY KEY,
+        address TEXT UNIQUE NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE participants (
+        message_id TEXT NOT NULL,
+        address_id INTEGER NOT NULL REFERENCES addresses(address_id),
+        role TEXT NOT NULL,
+        PRIMARY KEY (message_id, address_id, role)
+    ) WITHOUT ROWID
+    ''')
+    # Per-person lookups start from the address; the primary key already
+    # covers per-message lookups
+    conn.execute('''
+    CREATE INDEX idx_participants_address
+    ON participants (address_id, role, message_id)
+    ''')
+    conn.commit()
+
+
+def extract_participants(headers):
+    """Return every (address, role) pair from From/To/Cc/Reply-To headers"""
+    participants = []
+    for name, role in PARTICIPANT_HEADERS.items():
+        values = [h['value'] for h in headers if h['name'].lower() == name]
+        for _, address in getaddresses(values):
+            address = address.strip().lower()
+            if address and (address, role) not in participants:
+                participants.append((address, role))
+    return participants
+
+
+def addresses_for_role(participants, role):
+    """Addresses that appear in the given role, in header order"""
+    return [address for address, r in participants if r == role]
+
+
+def store_participants(conn, message_id, participants):
+    """Replace the stored participants of a message"""
+    conn.execute('DELETE FROM participants WHERE message_id = ?', (message_id,))
+    for address, role in participants:
+        conn.execute('INSERT OR IGNORE INTO addresses (address) VALUES (?)', (address,))
+        conn.execute('''
+        INSERT OR IGNORE INTO participants (message_id, address_id, role)
+        SELECT ?, address_id, ? FROM addresses WHERE address = ?
+        ''', (message_id, role, address))
+
+
+def person_volume(conn, role=None):
+    """Messages per address, optionally restricted to one role"""
+    query = '''
+    SELECT a.address, COUNT(DISTINCT p.message_id) AS count
+    FROM participants p
+    JOIN addresses a ON a.address_id = p.address_id
+    '''
+    params = ()
+    if role:
+        query += ' WHERE p.role = ?'
+        params = (role,)
+    query += ' GROUP BY a.address ORDER BY count DESC, a.address'
+    return conn.execute(query, params).fetchall()
+
+
+def person_response_times(conn, table, datetime_expr):
+    """Average hours each sender took to reply to the previous message in a thread
+
+    Only messages following one from a different address count as replies,
+    so follow-ups a sender sends to their own message are ignored.
+    """
+    return conn.execute(f'''
+    WITH ordered AS (
+        SELECT
+            p.address_id AS sender,
+            julianday({datetime_expr}) AS sent,
+            LAG(julianday({datetime_expr})) OVER thread AS previous,
+            LAG(p.address_id) OVER thread AS previous_sender
+        FROM {table} e
+        LEFT JOIN participants p ON p.message_id = e.message_id AND p.role = 'from'
+        WINDOW thread AS (PARTITION BY e.thread_id ORDER BY {datetime_expr})
+    )
+    SELECT a.address, AVG((o.sent - o.previous) * 24) AS avg_hours, COUNT(*) AS replies
+    FROM ordered o
+    JOIN addresses a ON a.address_id = o.sender
+    WHERE o.previous IS NOT NULL AND o.previous_sender IS NOT o.sender
+    GROUP BY a.address
+    ORDER BY avg_hours
+    ''').fetchall()
+
+
+def co_occurrence(conn, address, top_n=10):
+    """Addresses that most often appear on the same messages as the given one"""
+    return conn.execute('''
+    SELECT other.address, COUNT(DISTINCT p2.message_id) AS shared
+    FROM addresses person
+    JOIN participants p1 ON p1.address_id = person.address_id
+    JOIN participants p2 ON p2.message_id = p1.message_id AND p2.address_id != p1.address_id
+    JOIN addresses other ON other.address_id = p2.address_id
+    WHERE person.address = ?
+    GROUP BY other.address
+    ORDER BY shared DESC, other.address
+    LIMIT ?
+    ''', (address.lower(), top_n)).fetchall()
@@ -0,0 +1,156 @@
+import json
+import sqlite3
+
+
+def setup_sync_state(conn):
+    """Create the sync_state table used to track table rebuilds"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''')
+    conn.commit()
+
+
+def bump_generation(conn, table):
+    """Record that a table was dropped and rebuilt so cached stats are discarded"""
+    setup_sync_state(conn)
+    key = f'{table}_generation'
+    conn.execute('INSERT OR IGNORE INTO sync_state (key, value) VALUES (?, 0)', (key,))
+    conn.execute('UPDATE sync_state SET value = value + 1 WHERE key = ?', (key,))
+    conn.commit()
+
+
+def install_deletion_trigger(conn, table):
+    """Count every row deleted from a table (including REPLACE) in sync_state"""
+    setup_sync_state(conn)
+    key = f'{table}_deletions'
+    conn.execute('INSERT OR IGNORE INTO sync_state (key, value) VALUES (?, 0)', (key,))
+    # Without recursive_triggers the implicit delete of INSERT OR REPLACE
+    # does not fire DELETE triggers. The key is seeded above because the
+    # outer OR REPLACE would also override an OR IGNORE inside the trigger.
+    conn.execute('PRAGMA recursive_triggers = ON')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_count_deletions
+    AFTER DELETE ON {table}
+    BEGIN
+        UPDATE sync_state SET value = value + 1 WHERE key = '{key}';
+    END
+    ''')
+    conn.commit()
+
+
+def get_sync_value(conn, key, default=None):
+    """Read a value recorded in sync_state"""
+    setup_sync_state(conn)
+    row = conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_sync_value(conn, key, value):
+    """Record a value in sync_state"""
+    setup_sync_state(conn)
+    conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value))
+    conn.commit()
+
+
+def read_watermark(conn, table):
+    """Return the change watermark (generation, deletions, max rowid, row count) of a table"""
+    try:
+        state = dict(conn.execute(
+            'SELECT key, value FROM sync_state WHERE key IN (?, ?)',
+            (f'{table}_generation', f'{table}_deletions')
+        ).fetchall())
+    except sqlite3.OperationalError:
+        # Databases synced before sync_state existed
+        state = {}
+
+    max_rowid, row_count = conn.execute(
+        f'SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM {table}'
+    ).fetchone()
+    return {
+        'generation': state.get(f'{table}_generation', 0),
+        'deletions': state.get(f'{table}_deletions', 0),
+        'max_rowid': max_rowid,
+        'row_count': row_count
+    }
+
+
+class ReportCache:
+    """Analytics cache persisted next to the data it summarises"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_cache (
+            name TEXT PRIMARY KEY,
+            watermark TEXT,
+            stats TEXT
+        )
+        ''')
+        self.conn.commit()
+
+    def load(self, name):
+        """Return (watermark, stats) for a cached report, or (None, None)"""
+        row = self.conn.execute(
+            'SELECT watermark, stats FROM analytics_cache WHERE name = ?', (name,)
+        ).fetchone()
+        if not row:
+            return None, None
+        return json.loads(row[0]), json.loads(row[1])
+
+    def save(self, name, watermark, stats):
+        """Persist stats computed at the given watermark"""
+        self.conn.execute('''
+        INSERT OR REPLACE INTO analytics_cache (name, watermark, stats)
+        VALUES (?, ?, ?)
+        ''', (name, json.dumps(watermark), json.dumps(stats)))
+        self.conn.commit()
+
+    def get_stats(self, name, table, columns, new_stats, accumulate, full_scan=None):
+        """Return up-to-date stats, reusing the cache and folding in only new rows
+
+        new_stats() builds an empty, JSON-serialisable stats dict and
+        accumulate(stats, rows) merges an iterable of row tuples into it.
+        full_scan(max_rowid), if given, replaces the serial pass used when
+        the cache cannot be extended.
+        """
+        watermark = read_watermark(self.conn, table)
+        cached_watermark, stats = self.load(name)
+
+        # Nothing synced since the last run
+        if cached_watermark == watermark:
+            return stats
+
+        # Bound every read by the watermark so rows synced mid-report are
+        # picked up as delta next time rather than counted twice
+        query = f'SELECT {", ".join(columns)} FROM {table}'
+
+        # Only appended rows: merge the delta into the cached stats. Any
+        # rebuild, replace or delete (counted by the deletion trigger, since
+        # SQLite can reuse a deleted max rowid) forces a full pass.
+        if (
+            cached_watermark is not None
+            and cached_watermark['generation'] == watermark['generation']
+            and cached_watermark.get('deletions') == watermark['deletions']
+            and cached_watermark['max_rowid'] <= watermark['max_rowid']
+        ):
+            delta_rows = self.conn.execute(
+                query + ' WHERE rowid > ? AND rowid <= ?',
+                (cached_watermark['max_rowid'], watermark['max_rowid'])
+            ).fetchall()
+            if cached_watermark['row_count'] + len(delta_rows) == watermark['row_count']:
+                accumulate(stats, delta_rows)
+                self.save(name, watermark, stats)
+                return stats
+
+        if full_scan is not None:
+            stats = full_scan(watermark['max_rowid'])
+        else:
+            stats = new_stats()
+            accumulate(stats, self.conn.execute(
+                query + ' WHERE rowid <= ?', (watermark['max_rowid'],)
+            ))
+        self.save(name, watermark, stats)
+        return stats
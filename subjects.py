@@ -0,0 +1,64 @@
+import re
+
+# Reply/forward prefixes, including localized ones (AW: German, SV: Nordic,
+# WG: German forward, TR: French forward, RV/RES: Spanish/Portuguese, ...)
+# and counted variants such as "Re[2]:" or "RE(3):"
+SUBJECT_PREFIX = re.compile(
+    r'^(?:re|fw|fwd|aw|sv|vs|wg|tr|rv|res|enc|antw|antwort|odp|vl|ynt|atb)'
+    r'\s*(?:\[\d+\]|\(\d+\))?\s*[:：]\s*',
+    re.IGNORECASE
+)
+
+# Mailing-list tags such as "[innovera-team]" or "[EXTERNAL]"
+LIST_TAG = re.compile(r'^\[[^\]]*\]\s*')
+
+NO_SUBJECT_KEY = '(no subject)'
+
+
+def normalize_subject(subject):
+    """Reduce a subject to a topic key shared by every message in the conversation"""
+    key = ' '.join((subject or '').split())
+
+    # Prefixes and tags can be stacked in any order: "Re: [list] Fwd: AW: X"
+    previous = None
+    while key != previous:
+        previous = key
+        key = SUBJECT_PREFIX.sub('', key)
+        key = LIST_TAG.sub('', key)
+
+    key = key.casefold()
+    if not key or key == 'no subject':
+        return NO_SUBJECT_KEY
+    return key
+
+
+def create_subject_index(conn, table):
+    """Index the subject_key column so topic grouping is an index-only scan"""
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_subject_key ON {table} (subject_key)')
+    conn.commit()
+
+
+def common_topics(conn, table, top_n=5):
+    """Most common topics as (subject, count), grouped over the subject_key index
+
+    Each topic is shown as its shortest original subject (ties broken
+    alphabetically), which is usually the one without Re:/Fwd: prefixes.
+    """
+    return conn.execute(f'''
+    SELECT CASE WHEN subject_key = ? THEN subject_key ELSE subject END, count
+    FROM (
+        SELECT
+            subject_key,
+            substr(MIN(printf('%08d', LENGTH(subject)) || subject), 9) AS subject,
+            COUNT(*) AS count
+        FROM {table}
+        GROUP BY subject_key
+    )
+    ORDER BY count DESC, subject_key
+    LIMIT ?
+    ''', (NO_SUBJECT_KEY, top_n)).fetchall()
+
+
+def representative_subject(subjects):
+    """Shortest subject of a topic, the in-memory counterpart of common_topics"""
+    return min(subjects, key=lambda subject: (len(subject), subject))
@@ -0,0 +1,98 @@
+from body_storage import split_reply
+
+
+def test_top_posted_reply():
+    body = (
+        "Sounds good, see you Monday.\n"
+        "\n"
+        "On Fri, Mar 1, 2024 at 10:00 AM Bob <bob@example.com> wrote:\n"
+        "> Can we meet on Monday?\n"
+        ">\n"
+        "> Bob"
+    )
+    new, quoted, signature = split_reply(body)
+    assert new == "Sounds good, see you Monday."
+    assert quoted.startswith("On Fri, Mar 1, 2024")
+    assert quoted.endswith("> Bob")
+    assert signature == ''
+
+
+def test_top_posted_reply_with_wrapped_attribution():
+    body = (
+        "Thanks!\n"
+        "\n"
+        "On Fri, Mar 1, 2024 at 10:00 AM Bob Example <bob@example.com>\n"
+        "wrote:\n"
+        "> Here is the deck."
+    )
+    new, quoted, _ = split_reply(body)
+    assert new == "Thanks!"
+    assert "wrote:" in quoted and "> Here is the deck." in quoted
+
+
+def test_bottom_posted_reply():
+    body = (
+        "On Fri, Mar 1, 2024 at 10:00 AM Bob <bob@example.com> wrote:\n"
+        "> Can we meet on Monday?\n"
+        "\n"
+        "Monday works, 10am at the office.\n"
+        "\n"
+        "--\n"
+        "Alice"
+    )
+    new, quoted, signature = split_reply(body)
+    assert new == "Monday works, 10am at the office."
+    assert quoted.endswith("> Can we meet on Monday?")
+    assert signature == "--\nAlice"
+
+
+def test_inline_reply():
+    body = (
+        "On Fri, Mar 1, 2024 at 10:00 AM Bob <bob@example.com> wrote:\n"
+        "> Is the budget final?\n"
+        "Not yet, waiting on finance.\n"
+        "> Who owns the deck?\n"
+        "Carol does."
+    )
+    new, quoted, _ = split_reply(body)
+    assert new == "Not yet, waiting on finance.\nCarol does."
+    assert "> Is the budget final?" in quoted and "> Who owns the deck?" in quoted
+
+
+def test_prose_resembling_attribution_stays_new():
+    body = (
+        "I agree with most of it.\n"
+        "On the other hand, what you wrote:\n"
+        "the timeline is too tight."
+    )
+    new, quoted, _ = split_reply(body)
+    assert new == body
+    assert quoted == ''
+
+
+def test_outlook_history_is_quoted():
+    body = (
+        "Approved.\n"
+        "\n"
+        "-----Original Message-----\n"
+        "From: Bob\n"
+        "Sent: Friday\n"
+        "Please approve."
+    )
+    new, quoted, _ = split_reply(body)
+    assert new == "Approved."
+    assert quoted.endswith("Please approve.")
+
+
+def test_forwarded_message_is_new_content():
+    body = (
+        "FYI\n"
+        "\n"
+        "---------- Forwarded message ---------\n"
+        "From: Bob <bob@example.com>\n"
+        "Date: Fri, Mar 1, 2024\n"
+        "Quarterly numbers attached."
+    )
+    new, quoted, _ = split_reply(body)
+    assert new.endswith("Quarterly numbers attached.")
+    assert quoted == ''